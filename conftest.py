@@ -0,0 +1,25 @@
+"""
+pytest configuration for the simple-game-patcher E2E tests
+"""
+import os
+import sys
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--profile",
+        action="store_true",
+        help="profile the patcher in each test and write prof/<test>.pstats",
+    )
+
+
+def pytest_configure(config):
+    """Keep temporary test directories on tmpfs when /dev/shm is available"""
+    if (
+        sys.platform == "linux"
+        and not config.option.basetemp
+        and "PYTEST_DEBUG_TEMPROOT" not in os.environ
+        and os.access("/dev/shm", os.W_OK)
+    ):
+        os.environ["PYTEST_DEBUG_TEMPROOT"] = "/dev/shm"
+
@@ -61,6 +61,7 @@
             buildInputs = [
               (pkgs.python3.withPackages (python-pkgs: with python-pkgs; [
                 pytest
+                pytest-xdist
               ]))
             ];
           };
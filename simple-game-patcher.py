@@ -10,17 +10,91 @@ Usage:
 """
 
 import argparse
+import errno
 import fcntl
 import hashlib
 import json
+import mmap
+import os
 import shutil
+import stat
 import sys
-from dataclasses import asdict, dataclass
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# Read size used when streaming file contents
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# Files larger than this are memory-mapped for hashing
+MMAP_THRESHOLD = 64 * 1024 * 1024
+
+# Files modified this recently may still change without their mtime moving
+# (coarse filesystem timestamps), so their checksums are not cached
+RACY_MTIME_WINDOW_NS = 2 * 1_000_000_000
+
+# state.log is folded into state.json once it grows past this fraction of its size
+STATE_LOG_COMPACT_RATIO = 0.1
+
+# Cached checksums: "<algorithm>:<path>" -> (size, mtime_ns, checksum)
+ChecksumCache = Dict[str, Tuple[int, int, str]]
+
+# Checksum algorithms by name, the optional ones need their package installed
+HASH_ALGORITHMS = {"sha256": hashlib.sha256}
+if blake3 is not None:
+    HASH_ALGORITHMS["blake3"] = blake3.blake3
+if xxhash is not None:
+    HASH_ALGORITHMS["xxh3_128"] = xxhash.xxh3_128
+HASH_ALGORITHM_PACKAGES = {"blake3": "blake3", "xxh3_128": "xxhash"}
+
+LINK_MODES = ("copy", "hardlink")
+
+# Answers to a conflict prompt (matched lowercased) and the action they pick
+CONFLICT_CHOICES = {
+    "a": "abort",
+    "abort": "abort",
+    "r": "re-backup",
+    "re-backup": "re-backup",
+    "rebackup": "re-backup",
+    "f": "force",
+    "force": "force",
+}
+# Case-sensitive answers that apply an action to all remaining conflicts
+CONFLICT_ALL_CHOICES = {"R": "re-backup", "F": "force"}
+
+# Errors from os.link meaning hardlinks aren't possible here, rather than a real failure
+LINK_UNSUPPORTED_ERRNOS = (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP)
+
+# In-kernel copy primitives, tried in order: (src_fd, dst_fd, count) -> bytes copied
+KERNEL_COPY_FUNCTIONS = []
+if hasattr(os, "copy_file_range"):
+    KERNEL_COPY_FUNCTIONS.append(os.copy_file_range)
+if hasattr(os, "sendfile"):
+    KERNEL_COPY_FUNCTIONS.append(
+        lambda src_fd, dst_fd, count: os.sendfile(dst_fd, src_fd, None, count)
+    )
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class PatchedFile:
     """Represents a file that has been patched"""
 
@@ -28,14 +102,86 @@ class PatchedFile:
     original_checksum: Optional[str]  # None if file didn't exist
     patched_checksum: str
     has_backup: bool
+    # Stat fingerprint of the target right after patching, None in older states
+    patched_size: Optional[int] = None
+    patched_mtime_ns: Optional[int] = None
+    # Algorithm of both checksums, states from before it was configurable used sha256
+    checksum_algorithm: str = "sha256"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class GameConfig:
     """Configuration for a single game"""
 
     target: Path
     backup: Path
+    link_mode: str = "copy"  # How patch files are placed, one of LINK_MODES
+    hash_algorithm: str = "sha256"  # Checksum for new records, see HASH_ALGORITHMS
+
+
+def dump_json(data: Any, indent: bool = True) -> bytes:
+    """Serialize data (dataclasses included) to JSON, using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(
+        data,
+        indent=2 if indent else None,
+        # Slotted dataclasses list their fields in __slots__
+        default=lambda obj: {name: getattr(obj, name) for name in obj.__slots__},
+    ).encode()
+
+
+def load_json(data: bytes) -> Any:
+    """Parse JSON, using orjson when available"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def atomic_write(path: Path, data: bytes):
+    """Write a file by renaming a fully written temporary file over it"""
+    # A unique name, so writers that don't hold the game lock can't collide
+    fd, tmp_name = tempfile.mkstemp(
+        dir=path.parent, prefix=f".{path.name}.", suffix=".tmp"
+    )
+    try:
+        # mkstemp always creates 0600, keep the mode open() would have given
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.fchmod(fd, mode)
+        with open(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+    # Make the rename itself durable
+    dir_fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+@contextmanager
+def sequential_read(fd: int):
+    """Hint that fd is read once, front to back, then drop its pages from the cache"""
+    if not hasattr(os, "posix_fadvise"):
+        yield
+        return
+
+    os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+    try:
+        yield
+    finally:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
 
 
 class PatcherError(Exception):
@@ -55,14 +201,21 @@ class GameLock:
         self.lock_path.parent.mkdir(parents=True, exist_ok=True)
         self.lock_file = open(self.lock_path, "w")
         try:
-            fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
-        except BlockingIOError:
-            raise PatcherError("Another patcher operation is in progress for this game")
+            # POSIX record lock, which unlike flock also works over NFS. It covers
+            # the whole game since every operation shares the same state.json
+            fcntl.lockf(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError as e:
+            self.lock_file.close()
+            if e.errno in (errno.EACCES, errno.EAGAIN):
+                raise PatcherError(
+                    "Another patcher operation is in progress for this game"
+                )
+            raise
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         if self.lock_file:
-            fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_UN)
+            fcntl.lockf(self.lock_file, fcntl.LOCK_UN)
             self.lock_file.close()
 
 
@@ -75,7 +228,24 @@ class GamePatcher:
         self.patches_dir = config_dir / "patches" / game_name
         self.config = self._load_config()
         self.state_file = self.config.backup / "state.json"
+        # Changes made since state.json was last written, one JSON record per line
+        self.state_log_file = self.config.backup / "state.log"
+        self.checksum_cache_file = self.config.backup / "checksums.json"
+        # Patch files rarely change, so their digests outlive revert
+        self.patch_digests_file = (
+            config_dir / "cache" / game_name / "patch_digests.json"
+        )
         self.lock_file = self.config.backup / "patcher.lock"
+        self._checksum_cache = self._load_checksum_cache(self.checksum_cache_file)
+        self._patch_digests = self._load_checksum_cache(self.patch_digests_file)
+        # Digest of state.json as last read or written, None while state.log applies
+        self._state_digest: Optional[str] = None
+        # Digest of the state.json that state.log records apply on top of
+        self._state_base: Optional[str] = None
+        self._state_size = 0
+        self._state_log_size = 0
+        # Set when state.log has torn or stale records and must be compacted
+        self._state_log_broken = False
 
     def _load_config(self) -> GameConfig:
         """Load configuration for this game"""
@@ -90,94 +260,391 @@ class GamePatcher:
             raise PatcherError(f"Game '{self.game_name}' not found in config")
 
         game_config = config_data["games"][self.game_name]
+        link_mode = game_config.get("link_mode", "copy")
+        if link_mode not in LINK_MODES:
+            raise PatcherError(
+                f"Invalid link_mode '{link_mode}' for game '{self.game_name}', "
+                f"expected one of: {', '.join(LINK_MODES)}"
+            )
+
+        hash_algorithm = game_config.get("hash_algorithm", "sha256")
+        if hash_algorithm not in ("sha256", *HASH_ALGORITHM_PACKAGES):
+            raise PatcherError(
+                f"Invalid hash_algorithm '{hash_algorithm}' for game "
+                f"'{self.game_name}', expected one of: "
+                f"sha256, {', '.join(HASH_ALGORITHM_PACKAGES)}"
+            )
+
         return GameConfig(
             target=Path(game_config["target"]).expanduser(),
             backup=Path(game_config["backup"]).expanduser(),
+            link_mode=link_mode,
+            hash_algorithm=hash_algorithm,
+        )
+
+    def _load_checksum_cache(self, cache_file: Path) -> ChecksumCache:
+        """Load cached checksums, keyed by path and validated by (size, mtime_ns)"""
+        if not cache_file.exists():
+            return {}
+
+        try:
+            with open(cache_file, "rb") as f:
+                cache_data = load_json(f.read())
+            return {
+                path: (size, mtime_ns, checksum)
+                for path, (size, mtime_ns, checksum) in cache_data.items()
+            }
+        except (OSError, ValueError, TypeError):
+            # The cache is disposable, just start over
+            return {}
+
+    def _save_checksum_cache(self, cache_file: Path, cache: ChecksumCache):
+        """Save cached checksums"""
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write(cache_file, dump_json(cache, indent=False))
+        except OSError:
+            # The cache is disposable, e.g. status on a read-only backup directory
+            pass
+
+    def _remember_checksum(
+        self,
+        file_path: Path,
+        checksum: str,
+        st: os.stat_result,
+        cache: Optional[ChecksumCache] = None,
+        algorithm: Optional[str] = None,
+    ):
+        """Cache the checksum of a file as of the given stat result"""
+        if time.time_ns() - st.st_mtime_ns < RACY_MTIME_WINDOW_NS:
+            return
+        if cache is None:
+            cache = self._checksum_cache
+        key = f"{algorithm or self.config.hash_algorithm}:{file_path}"
+        cache[key] = (st.st_size, st.st_mtime_ns, checksum)
+
+    def _compute_checksum(
+        self,
+        file_path: Path,
+        cache: Optional[ChecksumCache] = None,
+        algorithm: Optional[str] = None,
+    ) -> str:
+        """Compute the checksum of a file, reusing the cached one if it is unchanged"""
+        if cache is None:
+            cache = self._checksum_cache
+        algorithm = algorithm or self.config.hash_algorithm
+        st = os.stat(file_path)
+        cached = cache.get(f"{algorithm}:{file_path}")
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+
+        checksum = self._hash_file(file_path, algorithm)
+        self._remember_checksum(file_path, checksum, st, cache, algorithm)
+        return checksum
+
+    def _is_unmodified(self, target_file: Path, file_info: PatchedFile) -> bool:
+        """Check if a target file still has its patched contents, hashing it only if its size or mtime changed"""
+        st = target_file.stat()
+        if (
+            st.st_size == file_info.patched_size
+            and st.st_mtime_ns == file_info.patched_mtime_ns
+        ):
+            return True
+        current_checksum = self._compute_checksum(
+            target_file, algorithm=file_info.checksum_algorithm
         )
+        return current_checksum == file_info.patched_checksum
+
+    def _new_hasher(self, algorithm: Optional[str] = None):
+        """Create a hash object for the given algorithm, the configured one by default"""
+        algorithm = algorithm or self.config.hash_algorithm
+        if algorithm not in HASH_ALGORITHMS:
+            package = HASH_ALGORITHM_PACKAGES.get(algorithm, algorithm)
+            raise PatcherError(
+                f"Checksum algorithm '{algorithm}' requires the '{package}' package"
+            )
+        return HASH_ALGORITHMS[algorithm]()
+
+    def _hash_file(self, file_path: Path, algorithm: Optional[str] = None) -> str:
+        """Compute the checksum of a file"""
+        hasher = self._new_hasher(algorithm)
+        with open(file_path, "rb", buffering=0) as f, sequential_read(f.fileno()):
+            if os.name == "posix" and os.fstat(f.fileno()).st_size > MMAP_THRESHOLD:
+                # Hash the whole mapping in one call, letting the kernel read ahead
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    if hasattr(mmap, "MADV_SEQUENTIAL"):
+                        mm.madvise(mmap.MADV_SEQUENTIAL)
+                    hasher.update(mm)
+                    return hasher.hexdigest()
+
+            if hasattr(hashlib, "file_digest"):
+                # Python 3.11+: the read loop runs in C
+                return hashlib.file_digest(f, lambda: hasher).hexdigest()
+
+            buf = bytearray(CHUNK_SIZE)
+            view = memoryview(buf)
+            while n := f.readinto(buf):
+                hasher.update(view[:n])
+            return hasher.hexdigest()
+
+    def _unshare(self, path: Path):
+        """Remove path if it is hardlinked, so writing to it can't change the other links"""
+        try:
+            if os.stat(path).st_nlink > 1:
+                os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def _copy_and_hash(self, src: Path, dst: Path) -> str:
+        """Copy a file and return the checksum of its contents, reading it only once"""
+        self._unshare(dst)
+        hasher = self._new_hasher()
+        buf = bytearray(CHUNK_SIZE)
+        view = memoryview(buf)
+        with open(src, "rb", buffering=0) as src_f, open(dst, "wb") as dst_f:
+            src_stat = os.fstat(src_f.fileno())
+            with sequential_read(src_f.fileno()):
+                while n := src_f.readinto(buf):
+                    dst_f.write(view[:n])
+                    hasher.update(view[:n])
+            dst_f.flush()
+            getattr(os, "fdatasync", os.fsync)(dst_f.fileno())
+        self._copy_metadata(src_stat, dst)
+        return hasher.hexdigest()
+
+    def _copy_metadata(self, src_stat: os.stat_result, dst: Path):
+        """Copy permission bits and timestamps, but not xattrs like copystat"""
+        os.chmod(dst, stat.S_IMODE(src_stat.st_mode))
+        os.utime(dst, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+
+    def _fast_copy(self, src: Path, dst: Path):
+        """Copy a file with its mode and timestamps, keeping the data in the kernel where possible"""
+        self._unshare(dst)
+        with open(src, "rb", buffering=0) as src_f, open(dst, "wb") as dst_f:
+            src_fd, dst_fd = src_f.fileno(), dst_f.fileno()
+            src_stat = os.fstat(src_fd)
+            with sequential_read(src_fd):
+                remaining = src_stat.st_size
+                for copy_range in KERNEL_COPY_FUNCTIONS:
+                    try:
+                        while remaining > 0:
+                            copied = copy_range(src_fd, dst_fd, remaining)
+                            if copied == 0:
+                                break
+                            remaining -= copied
+                        break
+                    except OSError:
+                        # Unsupported by this platform or filesystem pair, try the next one
+                        continue
+                # Copies whatever the kernel didn't, if anything
+                shutil.copyfileobj(src_f, dst_f, CHUNK_SIZE)
+        self._copy_metadata(src_stat, dst)
+
+    def _link_or_copy(self, src: Path, dst: Path):
+        """Place src at dst as a hardlink if link_mode allows it, otherwise as a copy"""
+        if self.config.link_mode == "hardlink":
+            if dst.exists() and os.path.samefile(src, dst):
+                return
 
-    def _compute_checksum(self, file_path: Path) -> str:
-        """Compute SHA256 checksum of a file"""
-        sha256 = hashlib.sha256()
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(8192), b""):
-                sha256.update(chunk)
-        return sha256.hexdigest()
+            # Link next to dst and rename over it, so the old inode is never written to
+            tmp_dst = dst.with_name(f".{dst.name}.patcher-link")
+            try:
+                os.link(src, tmp_dst)
+                os.replace(tmp_dst, dst)
+                return
+            except OSError as e:
+                tmp_dst.unlink(missing_ok=True)
+                if e.errno not in LINK_UNSUPPORTED_ERRNOS:
+                    raise
+
+        # copy_file_range reflinks on filesystems that support it (btrfs, XFS).
+        # The patch file's mtime is copied on purpose: it becomes the recorded
+        # patched_mtime_ns, which then stays the same when the patch is re-applied
+        self._fast_copy(src, dst)
 
     def _load_state(self) -> Dict[str, PatchedFile]:
-        """Load current patch state"""
+        """Load current patch state, replaying state.log on top of state.json"""
         if not self.state_file.exists():
+            # A log without the state it was based on is meaningless
             return {}
 
-        with open(self.state_file) as f:
-            state_data = json.load(f)
+        with open(self.state_file, "rb") as f:
+            raw_state = f.read()
+        self._state_base = hashlib.sha256(raw_state).hexdigest()
+        self._state_digest = self._state_base
+        self._state_size = len(raw_state)
+        state_data = load_json(raw_state)
 
-        return {
+        state = {
             path: PatchedFile(**file_data) for path, file_data in state_data.items()
         }
 
+        self._state_log_size = 0
+        self._state_log_broken = False
+        if self.state_log_file.exists():
+            with open(self.state_log_file, "rb") as f:
+                raw_log = f.read()
+            for line in raw_log.splitlines():
+                try:
+                    record = load_json(line)
+                except ValueError:
+                    # Torn write at the end of the log, appending after it would
+                    # corrupt the next record so the log gets compacted instead
+                    self._state_log_broken = True
+                    break
+                if record.get("base") != self._state_base:
+                    # Left over from a compaction interrupted before it removed
+                    # the log, state.json already includes these changes
+                    self._state_log_broken = True
+                    continue
+                if record["op"] == "add":
+                    state[record["path"]] = PatchedFile(**record["info"])
+                else:
+                    state.pop(record["path"], None)
+            if raw_log:
+                self._state_digest = None
+                self._state_log_size = len(raw_log)
+
+        return state
+
     def _save_state(self, state: Dict[str, PatchedFile]):
-        """Save patch state"""
+        """Save the full patch state and clear state.log, skipping the write if nothing changed"""
+        raw_state = dump_json(state)
+        digest = hashlib.sha256(raw_state).hexdigest()
+        if digest == self._state_digest and self.state_file.exists():
+            return
+
         self.state_file.parent.mkdir(parents=True, exist_ok=True)
-        with open(self.state_file, "w") as f:
-            json.dump(
-                {path: asdict(file_info) for path, file_info in state.items()},
-                f,
-                indent=2,
+        atomic_write(self.state_file, raw_state)
+        self.state_log_file.unlink(missing_ok=True)
+        self._state_digest = digest
+        self._state_base = digest
+        self._state_size = len(raw_state)
+        self._state_log_size = 0
+        self._state_log_broken = False
+
+    def _record_state_changes(
+        self, old_state: Dict[str, PatchedFile], new_state: Dict[str, PatchedFile]
+    ):
+        """Persist the difference between two states by appending to state.log, compacting it when it gets large"""
+        # Each record names the state.json it applies to, see _load_state
+        base = self._state_base
+        records = [
+            dump_json(
+                {"base": base, "op": "add", "path": path, "info": file_info},
+                indent=False,
             )
+            for path, file_info in new_state.items()
+            if old_state.get(path) != file_info
+        ]
+        records.extend(
+            dump_json({"base": base, "op": "remove", "path": path}, indent=False)
+            for path in old_state
+            if path not in new_state
+        )
+        if not records:
+            return
+
+        raw_records = b"".join(record + b"\n" for record in records)
+        log_size = self._state_log_size + len(raw_records)
+        if (
+            not self.state_file.exists()
+            or self._state_log_broken
+            or log_size > self._state_size * STATE_LOG_COMPACT_RATIO
+        ):
+            self._save_state(new_state)
+            return
+
+        with open(self.state_log_file, "ab") as f:
+            f.write(raw_records)
+            f.flush()
+            os.fsync(f.fileno())
+        self._state_digest = None
+        self._state_log_size = log_size
 
-    def _get_patch_files(self) -> List[Path]:
-        """Get all files in the patches directory"""
+    def _get_patch_files(self) -> List[Tuple[Path, str]]:
+        """Get all files in the patches directory as (path, relative path) pairs"""
         if not self.patches_dir.exists():
             raise PatcherError(f"Patches directory not found: {self.patches_dir}")
 
         patch_files = []
-        for path in self.patches_dir.rglob("*"):
-            if path.is_file():
-                patch_files.append(path)
-
+        pending = [("", str(self.patches_dir))]
+        while pending:
+            relative_dir, directory = pending.pop()
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    relative_path = os.path.join(relative_dir, entry.name)
+                    # DirEntry caches the file type from the directory listing
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append((relative_path, entry.path))
+                    elif entry.is_file():
+                        patch_files.append((Path(entry.path), relative_path))
+
+        # Directory listing order depends on the filesystem, apply in a stable one
+        patch_files.sort(key=lambda entry: entry[1])
         return patch_files
 
     def _check_conflicts(
         self, relative_path: str, target_file: Path, state: Dict[str, PatchedFile]
     ) -> Optional[str]:
         """Check if a target file has been modified externally. Returns conflict type or None."""
-        if not target_file.exists():
+        if relative_path not in state or not target_file.exists():
             return None
 
-        current_checksum = self._compute_checksum(target_file)
-
-        if relative_path in state:
-            file_info = state[relative_path]
-            if current_checksum != file_info.patched_checksum:
-                return "modified"
+        if not self._is_unmodified(target_file, state[relative_path]):
+            return "modified"
 
         return None
 
-    def _handle_conflict(self, relative_path: str, conflict_type: str) -> str:
-        """Prompt user for conflict resolution. Returns action: 'abort', 're-backup', or 'force'."""
-        print(f"\nConflict detected for {relative_path}:")
-        print(f"  File has been {conflict_type} since last patch")
+    def _handle_conflicts(
+        self, conflicts: List[Tuple[str, str]]
+    ) -> Optional[Dict[str, str]]:
+        """Prompt user for resolution of all conflicts at once. Returns the action per file ('re-backup' or 'force'), or None to abort."""
+        print(f"\nConflict detected for {len(conflicts)} file(s):")
+        for relative_path, conflict_type in conflicts:
+            print(f"  {relative_path}: file has been {conflict_type} since last patch")
         print("\nOptions:")
         print("  [a] Abort")
         print("  [r] Re-backup (use current file as new baseline)")
         print("  [f] Force overwrite (discard changes)")
-
-        while True:
-            choice = input("\nChoice [a/r/f]: ").lower().strip()
-            if choice in ("a", "abort"):
-                return "abort"
-            elif choice in ("r", "re-backup", "rebackup"):
-                return "re-backup"
-            elif choice in ("f", "force"):
-                return "force"
-            else:
-                print("Invalid choice. Please enter 'a', 'r', or 'f'.")
-
-    def _backup_file(self, target_file: Path, relative_path: str):
-        """Backup a file to the backup directory"""
+        print("  [R] Re-backup this and all remaining files")
+        print("  [F] Force overwrite this and all remaining files")
+
+        actions = {}
+        for relative_path, _ in conflicts:
+            while True:
+                choice = input(f"\nChoice for {relative_path} [a/r/f/R/F]: ").strip()
+                if choice in CONFLICT_ALL_CHOICES:
+                    for remaining_path, _ in conflicts:
+                        actions.setdefault(remaining_path, CONFLICT_ALL_CHOICES[choice])
+                    return actions
+
+                action = CONFLICT_CHOICES.get(choice.lower())
+                if action == "abort":
+                    return None
+                if action:
+                    actions[relative_path] = action
+                    break
+                print("Invalid choice. Please enter 'a', 'r', 'f', 'R' or 'F'.")
+
+        return actions
+
+    def _same_filesystem(self, path: Path, other: Path) -> bool:
+        """Check if two existing paths live on the same filesystem"""
+        return os.stat(path).st_dev == os.stat(other).st_dev
+
+    def _backup_file_and_hash(
+        self, target_file: Path, relative_path: str
+    ) -> Tuple[str, bool]:
+        """Backup a file into its (existing) backup directory. Returns its checksum and whether it was moved rather than copied."""
         backup_file = self.config.backup / relative_path
-        backup_file.parent.mkdir(parents=True, exist_ok=True)
-        shutil.copy2(target_file, backup_file)
+        if self._same_filesystem(target_file, backup_file.parent):
+            # The target is about to be overwritten anyway, so a rename is enough
+            checksum = self._compute_checksum(target_file)
+            os.replace(target_file, backup_file)
+            return checksum, True
+
+        return self._copy_and_hash(target_file, backup_file), False
 
     def _restore_file(self, relative_path: str, delete_backup: bool = True):
         """Restore a file from backup"""
@@ -185,14 +652,38 @@ class GamePatcher:
         target_file = self.config.target / relative_path
 
         if backup_file.exists():
-            shutil.copy2(backup_file, target_file)
-            if delete_backup:
-                backup_file.unlink()
+            if delete_backup and self._same_filesystem(backup_file, target_file.parent):
+                os.replace(backup_file, target_file)
+            else:
+                self._fast_copy(backup_file, target_file)
+                if delete_backup:
+                    backup_file.unlink()
         else:
             # File didn't exist originally, remove it
             if target_file.exists():
                 target_file.unlink()
 
+    def _stash_path(self, target_file: Path) -> Path:
+        """Where apply keeps a target's current contents while it is being replaced"""
+        return target_file.with_name(f".{target_file.name}.patcher-stash")
+
+    def _roll_back_file(self, op: Dict[str, Any], previous: Optional[PatchedFile]):
+        """Return a target touched by a failed apply to what it held before"""
+        target_file = op["target_file"]
+        if op["rollback"] == "stash":
+            os.replace(self._stash_path(target_file), target_file)
+        elif op["rollback"] == "repatch":
+            # Only a copy that failed halfway through needs redoing
+            if not target_file.exists() or not self._is_unmodified(
+                target_file, previous
+            ):
+                self._link_or_copy(op["patch_file"], target_file)
+        elif op["rollback"] == "remove":
+            target_file.unlink(missing_ok=True)
+        else:
+            # Restore file but don't delete backup (preserve for future operations)
+            self._restore_file(op["relative_path"], delete_backup=False)
+
     def apply(self):
         """Apply patches to the game"""
         with GameLock(self.lock_file):
@@ -208,95 +699,186 @@ class GamePatcher:
                 print(f"No patch files found in {self.patches_dir}")
                 return
 
-            # Pre-flight: check all patch files and detect conflicts
+            # Pre-flight: hash all patch files and detect conflicts
+            with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+                conflicts = executor.map(
+                    lambda entry: self._check_conflicts(
+                        entry[1], self.config.target / entry[1], state
+                    ),
+                    patch_files,
+                )
+                patched_checksums = executor.map(
+                    lambda entry: self._compute_checksum(entry[0], self._patch_digests),
+                    patch_files,
+                )
+                conflicts = list(conflicts)
+                patched_checksums = list(patched_checksums)
+
+            # Forget patch files that were deleted or renamed since the last apply
+            current_patches = {str(patch_file) for patch_file, _ in patch_files}
+            self._patch_digests = {
+                key: entry
+                for key, entry in self._patch_digests.items()
+                if key.split(":", 1)[1] in current_patches
+            }
+            self._save_checksum_cache(self.patch_digests_file, self._patch_digests)
+
+            # Conflicts are resolved together once all checksums are in
+            conflicting = [
+                (relative_path, conflict)
+                for (_, relative_path), conflict in zip(patch_files, conflicts)
+                if conflict
+            ]
+            actions = self._handle_conflicts(conflicting) if conflicting else {}
+            if actions is None:
+                print("\nPatching aborted.")
+                return
+
             operations = []
-            for patch_file in patch_files:
-                relative_path = str(patch_file.relative_to(self.patches_dir))
+            directories = set()
+            for (patch_file, relative_path), patched_checksum in zip(
+                patch_files, patched_checksums
+            ):
                 target_file = self.config.target / relative_path
-
-                needs_backup = target_file.exists()
-                conflict = (
-                    self._check_conflicts(relative_path, target_file, state)
-                    if needs_backup
-                    else None
+                action = actions.get(relative_path)
+                previous = state.get(relative_path)
+                # A file created by an earlier apply has no original to preserve,
+                # unless the user asked to keep its current contents
+                needs_backup = target_file.exists() and (
+                    previous is None or previous.has_backup or action == "re-backup"
                 )
 
                 force_rebackup = False
-                if conflict:
-                    action = self._handle_conflict(relative_path, conflict)
-                    if action == "abort":
-                        print("\nPatching aborted.")
-                        return
-                    elif action == "force":
-                        needs_backup = False  # Don't preserve the modified file
-                    elif action == "re-backup":
-                        force_rebackup = True  # Force a new backup of the modified file
+                if action == "force":
+                    needs_backup = False  # Don't preserve the modified file
+                elif action == "re-backup":
+                    force_rebackup = True  # Force a new backup of the modified file
+
+                fresh_backup = needs_backup and (
+                    relative_path not in state
+                    or not state[relative_path].has_backup
+                    or force_rebackup
+                )
+                directories.add(target_file.parent)
+                if fresh_backup:
+                    directories.add((self.config.backup / relative_path).parent)
+
+                # How to get back to the current contents if a later file fails
+                if previous is None or fresh_backup:
+                    rollback = "restore"  # From the backup, or by removing it
+                elif not target_file.exists():
+                    rollback = "remove"
+                elif (
+                    action is None
+                    and previous.patched_checksum == patched_checksum
+                    and previous.checksum_algorithm == self.config.hash_algorithm
+                ):
+                    rollback = "repatch"  # It already holds this very patch
+                else:
+                    rollback = "stash"  # An older patch, or changes being forced over
 
                 operations.append(
                     {
                         "patch_file": patch_file,
                         "relative_path": relative_path,
                         "target_file": target_file,
+                        "patched_checksum": patched_checksum,
                         "needs_backup": needs_backup,
-                        "force_rebackup": force_rebackup,
+                        "fresh_backup": fresh_backup,
+                        "rollback": rollback,
                     }
                 )
 
             # Execute patching with rollback on failure
             new_state = state.copy()
-            patched_files = []
+            patched_ops = []
+            stashes = []
 
             try:
+                # Create each directory once instead of once per file
+                for directory in directories:
+                    directory.mkdir(parents=True, exist_ok=True)
+
                 for op in operations:
                     patch_file = op["patch_file"]
                     relative_path = op["relative_path"]
                     target_file = op["target_file"]
+                    patched_checksum = op["patched_checksum"]
                     needs_backup = op["needs_backup"]
-                    force_rebackup = op["force_rebackup"]
 
                     # Backup if needed
                     original_checksum = None
+                    moved_original = False
                     if needs_backup:
-                        if (
-                            relative_path not in state
-                            or not state[relative_path].has_backup
-                            or force_rebackup
-                        ):
-                            self._backup_file(target_file, relative_path)
-                            original_checksum = self._compute_checksum(target_file)
+                        if op["fresh_backup"]:
+                            original_checksum, moved_original = (
+                                self._backup_file_and_hash(target_file, relative_path)
+                            )
                         else:
                             # Preserve original checksum from existing backup
                             original_checksum = state[relative_path].original_checksum
-
-                    # Copy patch file
-                    target_file.parent.mkdir(parents=True, exist_ok=True)
-                    shutil.copy2(patch_file, target_file)
+                            if (
+                                state[relative_path].checksum_algorithm
+                                != self.config.hash_algorithm
+                            ):
+                                # Rehash so the new record uses a single algorithm
+                                original_checksum = self._compute_checksum(
+                                    self.config.backup / relative_path
+                                )
+
+                    if op["rollback"] == "stash":
+                        stash_file = self._stash_path(target_file)
+                        stashes.append(stash_file)
+                        self._fast_copy(target_file, stash_file)
+
+                    rollback_first = moved_original or op["rollback"] != "restore"
+                    if rollback_first:
+                        # Rolling back doesn't depend on the patch having been
+                        # placed, so it's also needed if copying the patch fails
+                        patched_ops.append(op)
+
+                    # Place patch file
+                    self._link_or_copy(patch_file, target_file)
 
                     # Record operation
-                    patched_checksum = self._compute_checksum(patch_file)
+                    target_stat = target_file.stat()
+                    self._remember_checksum(target_file, patched_checksum, target_stat)
                     new_state[relative_path] = PatchedFile(
                         relative_path=relative_path,
                         original_checksum=original_checksum,
                         patched_checksum=patched_checksum,
                         has_backup=needs_backup,
+                        patched_size=target_stat.st_size,
+                        patched_mtime_ns=target_stat.st_mtime_ns,
+                        checksum_algorithm=self.config.hash_algorithm,
                     )
-                    patched_files.append(relative_path)
+                    if not rollback_first:
+                        patched_ops.append(op)
+
+                for stash_file in stashes:
+                    stash_file.unlink()
 
                 # Save state
-                self._save_state(new_state)
-                print(f"\nSuccessfully patched {len(patched_files)} file(s)")
+                self._record_state_changes(state, new_state)
+                self._save_checksum_cache(
+                    self.checksum_cache_file, self._checksum_cache
+                )
+                print(f"\nSuccessfully patched {len(patched_ops)} file(s)")
 
             except Exception as e:
                 # Rollback - restore files but preserve backups and old state
                 print(f"\nError during patching: {e}")
                 print("Rolling back changes...")
 
-                for relative_path in patched_files:
+                for op in patched_ops:
                     try:
-                        # Restore file but don't delete backup (preserve for future operations)
-                        self._restore_file(relative_path, delete_backup=False)
+                        self._roll_back_file(op, state.get(op["relative_path"]))
                     except Exception as rollback_error:
-                        print(f"  Error rolling back {relative_path}: {rollback_error}")
+                        print(
+                            f"  Error rolling back {op['relative_path']}: {rollback_error}"
+                        )
+                for stash_file in stashes:
+                    stash_file.unlink(missing_ok=True)
 
                 # Restore original state
                 self._save_state(state)
@@ -324,20 +906,34 @@ class GamePatcher:
                     # Remove state file
                     if self.state_file.exists():
                         self.state_file.unlink()
-
-                    # Remove empty directories
-                    for dirpath in sorted(
-                        self.config.backup.rglob("*"),
-                        key=lambda p: len(p.parts),
-                        reverse=True,
-                    ):
-                        if dirpath.is_dir() and not any(dirpath.iterdir()):
-                            dirpath.rmdir()
+                    if self.state_log_file.exists():
+                        self.state_log_file.unlink()
+                    if self.checksum_cache_file.exists():
+                        self.checksum_cache_file.unlink()
+
+                    # Remove empty directories, deepest first
+                    backup_root = str(self.config.backup)
+                    for dirpath, _, _ in os.walk(backup_root, topdown=False):
+                        if dirpath == backup_root:
+                            continue
+                        try:
+                            os.rmdir(dirpath)
+                        except OSError:
+                            pass  # Not empty
                 except Exception as e:
                     print(f"Warning: Could not clean up backup directory: {e}")
 
             print(f"Reverted {len(state)} file(s)")
 
+    def _file_status(self, relative_path: str, file_info: PatchedFile) -> str:
+        """Classify a patched file as 'clean', 'MODIFIED' or 'MISSING'"""
+        try:
+            if self._is_unmodified(self.config.target / relative_path, file_info):
+                return "clean"
+            return "MODIFIED"
+        except FileNotFoundError:
+            return "MISSING"
+
     def status(self):
         """Show current patch status"""
         state = self._load_state()
@@ -352,23 +948,24 @@ class GamePatcher:
         modified_count = 0
         missing_count = 0
 
-        for relative_path, file_info in sorted(state.items()):
-            target_file = self.config.target / relative_path
+        entries = sorted(state.items())
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            statuses = list(
+                executor.map(lambda entry: self._file_status(*entry), entries)
+            )
 
-            if not target_file.exists():
-                status = "MISSING"
+        for (relative_path, _), status in zip(entries, statuses):
+            if status == "MISSING":
                 missing_count += 1
+            elif status == "clean":
+                clean_count += 1
             else:
-                current_checksum = self._compute_checksum(target_file)
-                if current_checksum == file_info.patched_checksum:
-                    status = "clean"
-                    clean_count += 1
-                else:
-                    status = "MODIFIED"
-                    modified_count += 1
+                modified_count += 1
 
             print(f"  [{status:8}] {relative_path}")
 
+        self._save_checksum_cache(self.checksum_cache_file, self._checksum_cache)
+
         print(
             f"\nSummary: {clean_count} clean, {modified_count} modified, {missing_count} missing"
         )
@@ -417,7 +1014,7 @@ def init_config(config_dir: Path):
     print(f"  3. Run 'apply' command to patch your game")
 
 
-def main():
+def main(argv: Optional[List[str]] = None):
     parser = argparse.ArgumentParser(
         description="Manage file overlays for game modifications",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -433,7 +1030,7 @@ def main():
         help="Directory containing config.json and patches/ (default: script directory)",
     )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     try:
         if args.command == "init":
@@ -2,45 +2,85 @@
 E2E tests for simple-game-patcher
 Tests run in isolated temporary directories with real file operations
 """
+import cProfile
 import hashlib
+import importlib.util
+import io
 import json
+import multiprocessing
 import os
+import pickle
+import shutil
+import stat
 import subprocess
+import sys
 import tempfile
 import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+from functools import lru_cache
 from pathlib import Path
-from threading import Thread
 
 import pytest
 
 
-@pytest.fixture
-def test_env(tmp_path):
-    """Create isolated test environment with config, game target, and patches"""
-    config_dir = tmp_path / "config"
-    game_target = tmp_path / "game"
-    patches_dir = config_dir / "patches" / "testgame"
+CONFIG_TEMPLATE = json.dumps(
+    {"games": {"testgame": {"target": "__TARGET__", "backup": "__BACKUP__"}}}, indent=2
+)
+
+
+def write_config(config_dir, game_target):
+    """Write a config.json for testgame, with its backups kept under config_dir"""
+    backup = config_dir / "backups" / "testgame"
+    config = CONFIG_TEMPLATE.replace('"__TARGET__"', json.dumps(str(game_target)))
+    config = config.replace('"__BACKUP__"', json.dumps(str(backup)))
+    (config_dir / "config.json").write_bytes(config.encode())
+
+
+@pytest.fixture(scope="session")
+def template_tree(tmp_path_factory):
+    """Build the game target and patches layout once, for test_env to copy"""
+    root = tmp_path_factory.mktemp("template")
+    game_target = root / "game"
+    patches_dir = root / "config" / "patches" / "testgame"
 
-    config_dir.mkdir()
     game_target.mkdir()
     patches_dir.mkdir(parents=True)
 
-    config = {
-        "games": {
-            "testgame": {
-                "target": str(game_target),
-                "backup": str(config_dir / "backups" / "testgame")
-            }
-        }
-    }
-    (config_dir / "config.json").write_text(json.dumps(config, indent=2))
+    (game_target / "file1.txt").write_bytes(b"original content 1")
+    (game_target / "file2.txt").write_bytes(b"original content 2")
 
-    (game_target / "file1.txt").write_text("original content 1")
-    (game_target / "file2.txt").write_text("original content 2")
+    (patches_dir / "file1.txt").write_bytes(b"patched content 1")
+    (patches_dir / "file2.txt").write_bytes(b"patched content 2")
+    (patches_dir / "newfile.txt").write_bytes(b"new file content")
 
-    (patches_dir / "file1.txt").write_text("patched content 1")
-    (patches_dir / "file2.txt").write_text("patched content 2")
-    (patches_dir / "newfile.txt").write_text("new file content")
+    return root
+
+
+@pytest.fixture
+def test_env(tmp_path, template_tree):
+    """Create isolated test environment with config, game target, and patches"""
+    root = tmp_path / "env"
+    template_patches = template_tree / "config" / "patches"
+
+    # Tests only read the patch files, or replace them through replace_file, so
+    # they can share the template's inodes. Game files get modified in place
+    # (chmod, overwrites, backups), so those are real copies.
+    def link_patches(src, dst):
+        if Path(src).is_relative_to(template_patches):
+            os.link(src, dst)
+        else:
+            shutil.copy2(src, dst)
+
+    shutil.copytree(template_tree, root, copy_function=link_patches)
+
+    config_dir = root / "config"
+    game_target = root / "game"
+    patches_dir = config_dir / "patches" / "testgame"
+
+    # config.json embeds absolute paths, so it is written per test
+    write_config(config_dir, game_target)
 
     return {
         "config_dir": config_dir,
@@ -50,22 +90,132 @@ def test_env(tmp_path):
     }
 
 
-def run_patcher(script, config_dir, command):
-    """Run patcher command and return result"""
-    result = subprocess.run(
-        ["python3", str(script), "--config-dir", str(config_dir), command, "testgame"],
-        capture_output=True,
-        text=True
+def replace_file(path, data):
+    """Write data to a new inode at path, leaving other hardlinks untouched"""
+    path.unlink(missing_ok=True)
+    path.write_bytes(data)
+
+
+@lru_cache(maxsize=None)
+def load_patcher(script):
+    """Import the patcher script as a module, once per test process"""
+    spec = importlib.util.spec_from_file_location("simple_game_patcher", script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# cProfile.Profile collecting the current test's patcher runs under --profile
+profiler = None
+
+
+class InlineExecutor:
+    """ThreadPoolExecutor stand-in that runs the work on the calling thread"""
+
+    def __init__(self, max_workers=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def map(self, fn, *iterables):
+        return map(fn, *iterables)
+
+
+@pytest.fixture(autouse=True)
+def profile_patcher(request, monkeypatch):
+    """With --profile, profile the patcher's main() calls and dump prof/<test>.pstats"""
+    global profiler
+    if not request.config.getoption("profile"):
+        yield
+        return
+
+    # cProfile only sees the thread that enabled it, and even max_workers=1
+    # would hash in a worker thread, so run the patcher's pools inline
+    script = Path(__file__).parent / "simple-game-patcher.py"
+    monkeypatch.setattr(load_patcher(script), "ThreadPoolExecutor", InlineExecutor)
+    profiler = cProfile.Profile()
+    try:
+        yield
+    finally:
+        prof_dir = request.config.rootpath / "prof"
+        prof_dir.mkdir(exist_ok=True)
+        profiler.dump_stats(prof_dir / f"{request.node.name}.pstats")
+        profiler = None
+
+
+def invoke_patcher(script, argv, input=None):
+    """Run patcher main() in-process and return a CompletedProcess-like result"""
+    patcher = load_patcher(script)
+    stdout, stderr = io.StringIO(), io.StringIO()
+    stdin, sys.stdin = sys.stdin, io.StringIO(input or "")
+    try:
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                if profiler is None:
+                    patcher.main(argv)
+                else:
+                    profiler.runcall(patcher.main, argv)
+                returncode = 0
+            except SystemExit as e:
+                returncode = e.code if isinstance(e.code, int) else 1
+    finally:
+        sys.stdin = stdin
+    return subprocess.CompletedProcess(
+        argv, returncode, stdout.getvalue(), stderr.getvalue()
     )
-    return result
+
+
+def run_patcher(script, config_dir, *args, stdin=None, game="testgame"):
+    """Run a patcher command against config_dir and return result"""
+    argv = ["--config-dir", str(config_dir), *args]
+    if game is not None:
+        argv.append(game)
+    return invoke_patcher(script, argv, input=stdin)
+
+
+@contextmanager
+def readonly(path, read_only_mode=0o444):
+    """Make path read-only for the duration of the block, then restore its mode"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        mode = os.fstat(fd).st_mode & 0o7777
+        os.fchmod(fd, read_only_mode)
+        try:
+            yield
+        finally:
+            os.fchmod(fd, mode)
+    finally:
+        os.close(fd)
+
+
+def assert_files(root, expected):
+    """Assert the content of each file under root, None meaning it must not exist"""
+    for relative_path, content in expected.items():
+        path = root / relative_path
+        if content is None:
+            assert not path.exists(), relative_path
+            continue
+        if isinstance(content, str):
+            content = content.encode()
+        with open(path, "rb") as f:
+            assert f.read() == content, relative_path
 
 
 def compute_checksum(file_path):
     """Compute SHA256 checksum of a file"""
-    sha256 = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        sha256.update(f.read())
-    return sha256.hexdigest()
+    with open(file_path, "rb", buffering=0) as f:
+        if sys.version_info >= (3, 11):
+            return hashlib.file_digest(f, "sha256").hexdigest()
+        sha256 = hashlib.sha256()
+        buf = bytearray(1 << 20)
+        view = memoryview(buf)
+        while n := f.readinto(buf):
+            sha256.update(view[:n])
+        return sha256.hexdigest()
 
 
 def test_happy_path_apply_and_revert(test_env):
@@ -78,9 +228,11 @@ def test_happy_path_apply_and_revert(test_env):
     assert result.returncode == 0, f"Apply failed: {result.stderr}"
     assert "Successfully patched 3 file(s)" in result.stdout
 
-    assert (game_target / "file1.txt").read_text() == "patched content 1"
-    assert (game_target / "file2.txt").read_text() == "patched content 2"
-    assert (game_target / "newfile.txt").read_text() == "new file content"
+    assert_files(game_target, {
+        "file1.txt": "patched content 1",
+        "file2.txt": "patched content 2",
+        "newfile.txt": "new file content",
+    })
 
     result = run_patcher(script, config_dir, "status")
     assert result.returncode == 0
@@ -90,9 +242,11 @@ def test_happy_path_apply_and_revert(test_env):
     assert result.returncode == 0
     assert "Reverted 3 file(s)" in result.stdout
 
-    assert (game_target / "file1.txt").read_text() == "original content 1"
-    assert (game_target / "file2.txt").read_text() == "original content 2"
-    assert not (game_target / "newfile.txt").exists()
+    assert_files(game_target, {
+        "file1.txt": "original content 1",
+        "file2.txt": "original content 2",
+        "newfile.txt": None,
+    })
 
 
 def test_repatching_preserves_original_checksum(test_env):
@@ -111,7 +265,7 @@ def test_repatching_preserves_original_checksum(test_env):
     state = json.loads(state_file.read_text())
     assert state["file1.txt"]["original_checksum"] == original_checksum
 
-    (patches_dir / "file1.txt").write_text("patched content v2")
+    replace_file(patches_dir / "file1.txt", b"patched content v2")
 
     result = run_patcher(script, config_dir, "apply")
     assert result.returncode == 0
@@ -145,14 +299,10 @@ def test_rollback_preserves_existing_backups(test_env):
     backup_checksum = compute_checksum(backup_dir / "file1.txt")
 
     target_file = game_target / "file2.txt"
-    target_file.chmod(0o444)
-
-    try:
+    with readonly(target_file):
         result = run_patcher(script, config_dir, "apply")
         assert result.returncode != 0
         assert "rolling back" in result.stdout.lower()
-    finally:
-        target_file.chmod(0o644)
 
     assert (backup_dir / "file1.txt").exists()
     assert compute_checksum(backup_dir / "file1.txt") == backup_checksum
@@ -162,6 +312,9 @@ def test_rollback_preserves_existing_backups(test_env):
 
     assert (game_target / "file1.txt").read_text() == "patched content 1"
 
+    result = run_patcher(script, config_dir, "status")
+    assert "MODIFIED" not in result.stdout
+
 
 def test_conflict_detection(test_env):
     """Test 4: Detect when patched files are manually modified"""
@@ -172,16 +325,18 @@ def test_conflict_detection(test_env):
     result = run_patcher(script, config_dir, "apply")
     assert result.returncode == 0
 
-    (game_target / "file1.txt").write_text("manually modified content")
+    (game_target / "file1.txt").write_bytes(b"manually modified content")
 
     result = run_patcher(script, config_dir, "status")
     assert result.returncode == 0
     assert "MODIFIED" in result.stdout
     assert "file1.txt" in result.stdout
 
-    assert (game_target / "file1.txt").read_text() == "manually modified content"
-    assert (game_target / "file2.txt").read_text() == "patched content 2"
-    assert (game_target / "newfile.txt").read_text() == "new file content"
+    assert_files(game_target, {
+        "file1.txt": "manually modified content",
+        "file2.txt": "patched content 2",
+        "newfile.txt": "new file content",
+    })
 
 
 def test_new_file_handling(test_env):
@@ -204,6 +359,7 @@ def test_new_file_handling(test_env):
     assert not (game_target / "newfile.txt").exists()
 
 
+@pytest.mark.skipif(sys.platform == "win32", reason="requires os.fork")
 def test_concurrent_operations_blocked(test_env):
     """Test 6: Concurrent operations fail with lock error"""
     script = test_env["script"]
@@ -211,31 +367,54 @@ def test_concurrent_operations_blocked(test_env):
     game_target = test_env["game_target"]
     patches_dir = test_env["patches_dir"]
 
-    for i in range(20):
-        (patches_dir / f"file{i}.txt").write_text(f"content {i}")
+    def write_patch(i):
+        replace_file(patches_dir / f"file{i}.txt", f"content {i}".encode())
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(write_patch, range(20)))
+
+    # Import before forking so both children only race on the lock
+    load_patcher(script)
+    barrier = multiprocessing.get_context("fork").Barrier(2)
+
+    def fork_apply():
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 1
+            try:
+                os.close(read_fd)
+                try:
+                    # Don't wait forever if the other child never gets here
+                    barrier.wait(timeout=30)
+                    outcome = ("result", run_patcher(script, config_dir, "apply"))
+                    exit_code = 0
+                except BaseException:
+                    outcome = ("error", traceback.format_exc())
+                with os.fdopen(write_fd, "wb") as f:
+                    pickle.dump(outcome, f)
+            finally:
+                os._exit(exit_code)
+        os.close(write_fd)
+        return pid, read_fd
+
+    children = [fork_apply() for _ in range(2)]
 
     results = []
-
-    def run_apply(index):
-        result = subprocess.run(
-            ["python3", str(script), "--config-dir", str(config_dir), "apply", "testgame"],
-            capture_output=True,
-            text=True
-        )
-        results.append((index, result))
-
-    thread1 = Thread(target=run_apply, args=(1,))
-    thread2 = Thread(target=run_apply, args=(2,))
-
-    thread1.start()
-    thread2.start()
-
-    thread1.join()
-    thread2.join()
-
-    success_count = sum(1 for _, r in results if r.returncode == 0)
+    for pid, read_fd in children:
+        with os.fdopen(read_fd, "rb") as f:
+            payload = f.read()
+        _, wait_status = os.waitpid(pid, 0)
+        exit_code = os.waitstatus_to_exitcode(wait_status)
+        assert payload, f"apply child exited with status {exit_code} and no result"
+        kind, value = pickle.loads(payload)
+        assert kind == "result", f"apply child failed:\n{value}"
+        assert exit_code == 0
+        results.append(value)
+
+    success_count = sum(1 for r in results if r.returncode == 0)
     lock_error_count = sum(
-        1 for _, r in results
+        1 for r in results
         if r.returncode != 0 and (
             "lock" in r.stderr.lower() or
             "another patcher operation is in progress" in r.stderr.lower()
@@ -245,11 +424,17 @@ def test_concurrent_operations_blocked(test_env):
     assert success_count == 1, f"Expected 1 success, got {success_count}"
     assert lock_error_count == 1, f"Expected 1 lock error, got {lock_error_count}"
 
-    assert (game_target / "file1.txt").read_text() == "content 1"
-    assert (game_target / "file2.txt").read_text() == "content 2"
-    assert (game_target / "newfile.txt").read_text() == "new file content"
-    for i in range(20):
-        assert (game_target / f"file{i}.txt").read_text() == f"content {i}"
+    assert_files(game_target, {
+        "file1.txt": "content 1",
+        "file2.txt": "content 2",
+        "newfile.txt": "new file content",
+    })
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        contents = list(executor.map(
+            lambda i: (game_target / f"file{i}.txt").read_text(), range(20)
+        ))
+    assert contents == [f"content {i}" for i in range(20)]
 
 
 def test_missing_config_file(tmp_path):
@@ -272,11 +457,7 @@ def test_game_not_in_config(tmp_path):
     config = {"games": {"othergame": {"target": "/tmp/other", "backup": "/tmp/backup"}}}
     (config_dir / "config.json").write_text(json.dumps(config))
 
-    result = subprocess.run(
-        ["python3", str(script), "--config-dir", str(config_dir), "apply", "testgame"],
-        capture_output=True,
-        text=True
-    )
+    result = run_patcher(script, config_dir, "apply")
     assert result.returncode != 0
     assert "not found in config" in result.stderr or "testgame" in result.stderr
 
@@ -289,16 +470,8 @@ def test_missing_target_directory(tmp_path):
     patches_dir.mkdir(parents=True)
     script = Path(__file__).parent / "simple-game-patcher.py"
 
-    config = {
-        "games": {
-            "testgame": {
-                "target": str(tmp_path / "nonexistent"),
-                "backup": str(config_dir / "backups" / "testgame")
-            }
-        }
-    }
-    (config_dir / "config.json").write_text(json.dumps(config))
-    (patches_dir / "file1.txt").write_text("patch content")
+    write_config(config_dir, tmp_path / "nonexistent")
+    (patches_dir / "file1.txt").write_bytes(b"patch content")
 
     result = run_patcher(script, config_dir, "apply")
     assert result.returncode != 0
@@ -313,15 +486,7 @@ def test_missing_patches_directory(tmp_path):
     game_target.mkdir()
     script = Path(__file__).parent / "simple-game-patcher.py"
 
-    config = {
-        "games": {
-            "testgame": {
-                "target": str(game_target),
-                "backup": str(config_dir / "backups" / "testgame")
-            }
-        }
-    }
-    (config_dir / "config.json").write_text(json.dumps(config))
+    write_config(config_dir, game_target)
 
     result = run_patcher(script, config_dir, "apply")
     assert result.returncode != 0
@@ -337,14 +502,9 @@ def test_conflict_resolution_abort(test_env):
     result = run_patcher(script, config_dir, "apply")
     assert result.returncode == 0
 
-    (game_target / "file1.txt").write_text("manually modified content")
+    (game_target / "file1.txt").write_bytes(b"manually modified content")
 
-    result = subprocess.run(
-        ["python3", str(script), "--config-dir", str(config_dir), "apply", "testgame"],
-        input="a\n",  # Choose abort
-        capture_output=True,
-        text=True
-    )
+    result = run_patcher(script, config_dir, "apply", stdin="a\n")  # Choose abort
 
     assert "Conflict detected" in result.stdout
     assert "Patching aborted" in result.stdout
@@ -362,16 +522,11 @@ def test_conflict_resolution_force(test_env):
     result = run_patcher(script, config_dir, "apply")
     assert result.returncode == 0
 
-    (game_target / "file1.txt").write_text("manually modified content")
+    (game_target / "file1.txt").write_bytes(b"manually modified content")
 
-    (patches_dir / "file1.txt").write_text("patched content v2")
+    replace_file(patches_dir / "file1.txt", b"patched content v2")
 
-    result = subprocess.run(
-        ["python3", str(script), "--config-dir", str(config_dir), "apply", "testgame"],
-        input="f\n",  # Choose force
-        capture_output=True,
-        text=True
-    )
+    result = run_patcher(script, config_dir, "apply", stdin="f\n")  # Choose force
 
     assert result.returncode == 0
     assert "Conflict detected" in result.stdout
@@ -392,16 +547,11 @@ def test_conflict_resolution_rebackup(test_env):
     assert result.returncode == 0
 
     modified_content = "manually modified content"
-    (game_target / "file1.txt").write_text(modified_content)
+    (game_target / "file1.txt").write_bytes(modified_content.encode())
 
-    (patches_dir / "file1.txt").write_text("patched content v2")
+    replace_file(patches_dir / "file1.txt", b"patched content v2")
 
-    result = subprocess.run(
-        ["python3", str(script), "--config-dir", str(config_dir), "apply", "testgame"],
-        input="r\n",  # Choose re-backup
-        capture_output=True,
-        text=True
-    )
+    result = run_patcher(script, config_dir, "apply", stdin="r\n")  # Choose re-backup
 
     assert result.returncode == 0
     assert "Conflict detected" in result.stdout
@@ -424,23 +574,27 @@ def test_subdirectory_patches(test_env):
     patches_dir = test_env["patches_dir"]
 
     (game_target / "data" / "levels").mkdir(parents=True)
-    (game_target / "data" / "levels" / "level1.dat").write_text("original level 1")
+    (game_target / "data" / "levels" / "level1.dat").write_bytes(b"original level 1")
 
     (patches_dir / "data" / "levels").mkdir(parents=True)
-    (patches_dir / "data" / "levels" / "level1.dat").write_text("modded level 1")
-    (patches_dir / "data" / "config.ini").write_text("modded config")
+    (patches_dir / "data" / "levels" / "level1.dat").write_bytes(b"modded level 1")
+    (patches_dir / "data" / "config.ini").write_bytes(b"modded config")
 
     result = run_patcher(script, config_dir, "apply")
     assert result.returncode == 0
 
-    assert (game_target / "data" / "levels" / "level1.dat").read_text() == "modded level 1"
-    assert (game_target / "data" / "config.ini").read_text() == "modded config"
+    assert_files(game_target, {
+        "data/levels/level1.dat": "modded level 1",
+        "data/config.ini": "modded config",
+    })
 
     result = run_patcher(script, config_dir, "revert")
     assert result.returncode == 0
 
-    assert (game_target / "data" / "levels" / "level1.dat").read_text() == "original level 1"
-    assert not (game_target / "data" / "config.ini").exists()
+    assert_files(game_target, {
+        "data/levels/level1.dat": "original level 1",
+        "data/config.ini": None,
+    })
 
     backup_dir = config_dir / "backups" / "testgame"
     assert not (backup_dir / "data").exists() or not any((backup_dir / "data").rglob("*"))
@@ -456,17 +610,21 @@ def test_no_patches_applied_status(test_env):
     assert result.returncode == 0
     assert "No patches applied" in result.stdout
 
-    assert (game_target / "file1.txt").read_text() == "original content 1"
-    assert (game_target / "file2.txt").read_text() == "original content 2"
-    assert not (game_target / "newfile.txt").exists()
+    assert_files(game_target, {
+        "file1.txt": "original content 1",
+        "file2.txt": "original content 2",
+        "newfile.txt": None,
+    })
 
     result = run_patcher(script, config_dir, "revert")
     assert result.returncode == 0
     assert "No patches applied" in result.stdout
 
-    assert (game_target / "file1.txt").read_text() == "original content 1"
-    assert (game_target / "file2.txt").read_text() == "original content 2"
-    assert not (game_target / "newfile.txt").exists()
+    assert_files(game_target, {
+        "file1.txt": "original content 1",
+        "file2.txt": "original content 2",
+        "newfile.txt": None,
+    })
 
 
 def test_patched_file_missing(test_env):
@@ -485,9 +643,11 @@ def test_patched_file_missing(test_env):
     assert "MISSING" in result.stdout
     assert "file1.txt" in result.stdout
 
-    assert not (game_target / "file1.txt").exists()
-    assert (game_target / "file2.txt").read_text() == "patched content 2"
-    assert (game_target / "newfile.txt").read_text() == "new file content"
+    assert_files(game_target, {
+        "file1.txt": None,
+        "file2.txt": "patched content 2",
+        "newfile.txt": "new file content",
+    })
 
 
 def test_multiple_patch_versions_over_time(test_env):
@@ -501,22 +661,26 @@ def test_multiple_patch_versions_over_time(test_env):
     assert result.returncode == 0
     assert (game_target / "file1.txt").read_text() == "patched content 1"
 
-    (patches_dir / "file1.txt").write_text("patched content v2")
+    replace_file(patches_dir / "file1.txt", b"patched content v2")
     result = run_patcher(script, config_dir, "apply")
     assert result.returncode == 0
     assert (game_target / "file1.txt").read_text() == "patched content v2"
 
-    (patches_dir / "file1.txt").write_text("patched content v3")
-    (patches_dir / "file3.txt").write_text("new patch file v3")
+    replace_file(patches_dir / "file1.txt", b"patched content v3")
+    (patches_dir / "file3.txt").write_bytes(b"new patch file v3")
     result = run_patcher(script, config_dir, "apply")
     assert result.returncode == 0
-    assert (game_target / "file1.txt").read_text() == "patched content v3"
-    assert (game_target / "file3.txt").read_text() == "new patch file v3"
+    assert_files(game_target, {
+        "file1.txt": "patched content v3",
+        "file3.txt": "new patch file v3",
+    })
 
     result = run_patcher(script, config_dir, "revert")
     assert result.returncode == 0
-    assert (game_target / "file1.txt").read_text() == "original content 1"
-    assert not (game_target / "file3.txt").exists()
+    assert_files(game_target, {
+        "file1.txt": "original content 1",
+        "file3.txt": None,
+    })
 
 
 def test_game_update_simulation(test_env):
@@ -531,8 +695,8 @@ def test_game_update_simulation(test_env):
     assert result.returncode == 0
     assert (game_target / "file1.txt").read_text() == "patched content 1"
 
-    (game_target / "file1.txt").write_text("original content 1 - updated by game")
-    (game_target / "file2.txt").write_text("original content 2 - updated by game")
+    (game_target / "file1.txt").write_bytes(b"original content 1 - updated by game")
+    (game_target / "file2.txt").write_bytes(b"original content 2 - updated by game")
 
     result = run_patcher(script, config_dir, "status")
     assert result.returncode == 0
@@ -540,12 +704,7 @@ def test_game_update_simulation(test_env):
     assert "file1.txt" in result.stdout
     assert "file2.txt" in result.stdout
 
-    result = subprocess.run(
-        ["python3", str(script), "--config-dir", str(config_dir), "apply", "testgame"],
-        input="r\nr\n",
-        capture_output=True,
-        text=True
-    )
+    result = run_patcher(script, config_dir, "apply", stdin="r\nr\n")
     assert result.returncode == 0
     assert (game_target / "file1.txt").read_text() == "patched content 1"
 
@@ -555,8 +714,10 @@ def test_game_update_simulation(test_env):
 
     result = run_patcher(script, config_dir, "revert")
     assert result.returncode == 0
-    assert (game_target / "file1.txt").read_text() == "original content 1 - updated by game"
-    assert (game_target / "file2.txt").read_text() == "original content 2 - updated by game"
+    assert_files(game_target, {
+        "file1.txt": "original content 1 - updated by game",
+        "file2.txt": "original content 2 - updated by game",
+    })
 
 
 def test_command_line_validation(tmp_path):
@@ -565,42 +726,18 @@ def test_command_line_validation(tmp_path):
     config_dir.mkdir()
     script = Path(__file__).parent / "simple-game-patcher.py"
 
-    config = {
-        "games": {
-            "testgame": {
-                "target": str(tmp_path / "game"),
-                "backup": str(config_dir / "backups" / "testgame")
-            }
-        }
-    }
-    (config_dir / "config.json").write_text(json.dumps(config))
+    write_config(config_dir, tmp_path / "game")
 
-    result = subprocess.run(
-        ["python3", str(script)],
-        capture_output=True,
-        text=True
-    )
+    result = invoke_patcher(script, [])
     assert result.returncode != 0
 
-    result = subprocess.run(
-        ["python3", str(script), "--config-dir", str(config_dir)],
-        capture_output=True,
-        text=True
-    )
+    result = invoke_patcher(script, ["--config-dir", str(config_dir)])
     assert result.returncode != 0
 
-    result = subprocess.run(
-        ["python3", str(script), "--config-dir", str(config_dir), "invalidcommand", "testgame"],
-        capture_output=True,
-        text=True
-    )
+    result = run_patcher(script, config_dir, "invalidcommand")
     assert result.returncode != 0
 
-    result = subprocess.run(
-        ["python3", str(script), "--config-dir", str(config_dir), "apply"],
-        capture_output=True,
-        text=True
-    )
+    result = invoke_patcher(script, ["--config-dir", str(config_dir), "apply"])
     assert result.returncode != 0
 
 
@@ -630,75 +767,40 @@ def test_state_deleted_between_operations(test_env):
     assert (game_target / "file1.txt").read_text() == "patched content 1"
 
 
-def test_init_creates_template_config(tmp_path):
-    """Test 21: Init command creates template config.json with example"""
-    config_dir = tmp_path / "config"
-    script = Path(__file__).parent / "simple-game-patcher.py"
-
-    result = subprocess.run(
-        ["python3", str(script), "--config-dir", str(config_dir), "init"],
-        capture_output=True,
-        text=True
-    )
-
-    assert result.returncode == 0
-    assert "Successfully initialized" in result.stdout
-
-    assert (config_dir / "config.json").exists()
-    assert (config_dir / "patches" / "example-game").exists()
-    assert (config_dir / "patches" / "example-game").is_dir()
-
-    config = json.loads((config_dir / "config.json").read_text())
-    assert "games" in config
-    assert "example-game" in config["games"]
-    assert config["games"]["example-game"]["target"] == "/path/to/game/directory"
-    assert "backup" in config["games"]["example-game"]
-
-
-def test_init_overwrites_existing_config(tmp_path):
-    """Test 22: Init can overwrite existing config.json"""
-    config_dir = tmp_path / "config"
-    config_dir.mkdir(parents=True)
-    config_file = config_dir / "config.json"
-    script = Path(__file__).parent / "simple-game-patcher.py"
-
-    config_file.write_text('{"games": {"oldgame": {"target": "/old/path", "backup": "/old/backup"}}}')
-
-    result = subprocess.run(
-        ["python3", str(script), "--config-dir", str(config_dir), "init"],
-        input="y\n",
-        capture_output=True,
-        text=True
-    )
-    assert result.returncode == 0
-    assert "already exists" in result.stdout
+OLD_CONFIG = {"games": {"oldgame": {"target": "/old/path", "backup": "/old/backup"}}}
 
-    config = json.loads(config_file.read_text())
-    assert "example-game" in config["games"]
-    assert "oldgame" not in config["games"]
 
-
-def test_init_abort_overwrite(tmp_path):
-    """Test 23: Init aborts when user declines to overwrite"""
+@pytest.mark.parametrize(
+    "existing_config, stdin_input, expect_substring, expect_games",
+    [
+        (None, None, "Successfully initialized", {"example-game"}),
+        (OLD_CONFIG, "y\n", "already exists", {"example-game"}),
+        (OLD_CONFIG, "n\n", "cancelled", {"oldgame"}),
+    ],
+    ids=["creates_template_config", "overwrites_existing_config", "abort_overwrite"],
+)
+def test_init(tmp_path, existing_config, stdin_input, expect_substring, expect_games):
+    """Tests 21-23: Init creates a template config.json, overwriting an existing one only when confirmed"""
     config_dir = tmp_path / "config"
-    config_dir.mkdir(parents=True)
     config_file = config_dir / "config.json"
     script = Path(__file__).parent / "simple-game-patcher.py"
 
-    original_config = {"games": {"oldgame": {"target": "/old/path", "backup": "/old/backup"}}}
-    config_file.write_text(json.dumps(original_config))
+    if existing_config is not None:
+        config_dir.mkdir(parents=True)
+        config_file.write_text(json.dumps(existing_config))
 
-    result = subprocess.run(
-        ["python3", str(script), "--config-dir", str(config_dir), "init"],
-        input="n\n",
-        capture_output=True,
-        text=True
-    )
+    result = run_patcher(script, config_dir, "init", stdin=stdin_input, game=None)
     assert result.returncode == 0
-    assert "cancelled" in result.stdout
+    assert expect_substring in result.stdout
 
     config = json.loads(config_file.read_text())
-    assert config == original_config
+    assert set(config["games"]) == expect_games
+    if "example-game" in expect_games:
+        assert (config_dir / "patches" / "example-game").is_dir()
+        assert config["games"]["example-game"]["target"] == "/path/to/game/directory"
+        assert "backup" in config["games"]["example-game"]
+    else:
+        assert config == existing_config
 
 
 def test_init_then_apply_patches_integration(tmp_path):
@@ -708,13 +810,9 @@ def test_init_then_apply_patches_integration(tmp_path):
     game_target.mkdir(parents=True)
     script = Path(__file__).parent / "simple-game-patcher.py"
 
-    (game_target / "file1.txt").write_text("original content")
+    (game_target / "file1.txt").write_bytes(b"original content")
 
-    result = subprocess.run(
-        ["python3", str(script), "--config-dir", str(config_dir), "init"],
-        capture_output=True,
-        text=True
-    )
+    result = run_patcher(script, config_dir, "init", game=None)
     assert result.returncode == 0
 
     config_file = config_dir / "config.json"
@@ -728,28 +826,464 @@ def test_init_then_apply_patches_integration(tmp_path):
 
     patches_dir = config_dir / "patches" / "testgame"
     patches_dir.mkdir(parents=True, exist_ok=True)
-    (patches_dir / "file1.txt").write_text("patched content")
-    (patches_dir / "newfile.txt").write_text("new content")
+    (patches_dir / "file1.txt").write_bytes(b"patched content")
+    (patches_dir / "newfile.txt").write_bytes(b"new content")
 
-    result = subprocess.run(
-        ["python3", str(script), "--config-dir", str(config_dir), "apply", "testgame"],
-        capture_output=True,
-        text=True
-    )
+    result = run_patcher(script, config_dir, "apply")
     assert result.returncode == 0
 
-    assert (game_target / "file1.txt").read_text() == "patched content"
-    assert (game_target / "newfile.txt").read_text() == "new content"
+    assert_files(game_target, {
+        "file1.txt": "patched content",
+        "newfile.txt": "new content",
+    })
 
-    result = subprocess.run(
-        ["python3", str(script), "--config-dir", str(config_dir), "revert", "testgame"],
-        capture_output=True,
-        text=True
-    )
+    result = run_patcher(script, config_dir, "revert")
     assert result.returncode == 0
 
-    assert (game_target / "file1.txt").read_text() == "original content"
-    assert not (game_target / "newfile.txt").exists()
+    assert_files(game_target, {
+        "file1.txt": "original content",
+        "newfile.txt": None,
+    })
+
+
+def test_hardlink_mode_keeps_patch_files_intact(test_env):
+    """Test 25: Hardlinked patches are applied, re-applied and reverted without touching the patch files"""
+    script = test_env["script"]
+    config_dir = test_env["config_dir"]
+    game_target = test_env["game_target"]
+    patches_dir = test_env["patches_dir"]
+
+    config_file = config_dir / "config.json"
+    config = json.loads(config_file.read_text())
+    config["games"]["testgame"]["link_mode"] = "hardlink"
+    config_file.write_text(json.dumps(config, indent=2))
+
+    result = run_patcher(script, config_dir, "apply")
+    assert result.returncode == 0
+    assert (game_target / "file1.txt").samefile(patches_dir / "file1.txt")
+    assert (game_target / "newfile.txt").read_text() == "new file content"
+
+    result = run_patcher(script, config_dir, "apply")
+    assert result.returncode == 0
+
+    result = run_patcher(script, config_dir, "status")
+    assert result.returncode == 0
+    assert "MODIFIED" not in result.stdout
+
+    result = run_patcher(script, config_dir, "revert")
+    assert result.returncode == 0
+    assert (game_target / "file1.txt").read_text() == "original content 1"
+    assert_files(patches_dir, {
+        "file1.txt": "patched content 1",
+        "newfile.txt": "new file content",
+    })
+
+
+def test_conflict_resolution_force_all(test_env):
+    """Test 26: Conflict resolution - force overwrite applied to all remaining conflicts"""
+    script = test_env["script"]
+    config_dir = test_env["config_dir"]
+    game_target = test_env["game_target"]
+
+    result = run_patcher(script, config_dir, "apply")
+    assert result.returncode == 0
+
+    (game_target / "file1.txt").write_bytes(b"manually modified content 1")
+    (game_target / "file2.txt").write_bytes(b"manually modified content 2")
+
+    result = run_patcher(script, config_dir, "apply", stdin="F\n")  # Force all, answered once
+
+    assert result.returncode == 0
+    assert "Conflict detected for 2 file(s)" in result.stdout
+    assert "Successfully patched" in result.stdout
+
+    assert_files(game_target, {
+        "file1.txt": "patched content 1",
+        "file2.txt": "patched content 2",
+    })
+
+
+def test_noop_reapply_keeps_state_file(test_env):
+    """Test 27: Re-applying unchanged patches doesn't rewrite state.json"""
+    script = test_env["script"]
+    config_dir = test_env["config_dir"]
+    game_target = test_env["game_target"]
+    backup_dir = config_dir / "backups" / "testgame"
+    state_file = backup_dir / "state.json"
+
+    result = run_patcher(script, config_dir, "apply")
+    assert result.returncode == 0
+    state_stat = state_file.stat()
+
+    result = run_patcher(script, config_dir, "apply")
+    assert result.returncode == 0
+    assert "Successfully patched 3 file(s)" in result.stdout
+
+    assert state_file.stat().st_ino == state_stat.st_ino
+    assert state_file.stat().st_mtime_ns == state_stat.st_mtime_ns
+    assert not (backup_dir / "state.log").exists()
+
+    # newfile.txt was created by the first apply, so it must not be backed up
+    result = run_patcher(script, config_dir, "revert")
+    assert result.returncode == 0
+    assert_files(game_target, {
+        "file1.txt": "original content 1",
+        "newfile.txt": None,
+    })
+
+
+def add_patch_files(patches_dir, count):
+    """Add extra patch files, so a single changed entry is small next to state.json"""
+    for i in range(count):
+        (patches_dir / f"extra{i}.txt").write_bytes(f"extra content {i}".encode())
+
+
+def test_state_log_records_small_changes(test_env):
+    """Test 28: Re-applying a few changed patches appends to state.log instead of rewriting state.json"""
+    script = test_env["script"]
+    config_dir = test_env["config_dir"]
+    game_target = test_env["game_target"]
+    patches_dir = test_env["patches_dir"]
+    backup_dir = config_dir / "backups" / "testgame"
+    state_file = backup_dir / "state.json"
+    state_log = backup_dir / "state.log"
+
+    add_patch_files(patches_dir, 30)
+    result = run_patcher(script, config_dir, "apply")
+    assert result.returncode == 0
+    assert not state_log.exists()
+    raw_state = state_file.read_bytes()
+
+    replace_file(patches_dir / "file1.txt", b"patched content v2")
+    result = run_patcher(script, config_dir, "apply")
+    assert result.returncode == 0
+    assert state_file.read_bytes() == raw_state
+    assert len(state_log.read_bytes().splitlines()) == 1
+
+    # The logged entry is replayed, so the new patch isn't seen as modified
+    result = run_patcher(script, config_dir, "status")
+    assert result.returncode == 0
+    assert "MODIFIED" not in result.stdout
+
+    result = run_patcher(script, config_dir, "revert")
+    assert result.returncode == 0
+    assert_files(game_target, {
+        "file1.txt": "original content 1",
+        "extra0.txt": None,
+    })
+    assert not state_file.exists()
+    assert not state_log.exists()
+
+
+def test_state_log_torn_record(test_env):
+    """Test 29: A torn record at the end of state.log is ignored and the log gets compacted"""
+    script = test_env["script"]
+    config_dir = test_env["config_dir"]
+    patches_dir = test_env["patches_dir"]
+    backup_dir = config_dir / "backups" / "testgame"
+    state_file = backup_dir / "state.json"
+    state_log = backup_dir / "state.log"
+
+    add_patch_files(patches_dir, 30)
+    result = run_patcher(script, config_dir, "apply")
+    assert result.returncode == 0
+
+    replace_file(patches_dir / "file1.txt", b"patched content v2")
+    result = run_patcher(script, config_dir, "apply")
+    assert result.returncode == 0
+
+    with open(state_log, "ab") as f:
+        f.write(b'{"base": "')
+
+    result = run_patcher(script, config_dir, "status")
+    assert result.returncode == 0
+    assert "MODIFIED" not in result.stdout
+
+    replace_file(patches_dir / "file2.txt", b"patched content v2")
+    result = run_patcher(script, config_dir, "apply")
+    assert result.returncode == 0
+    assert not state_log.exists()
+
+    state = json.loads(state_file.read_text())
+    for name in ("file1.txt", "file2.txt"):
+        assert state[name]["patched_checksum"] == compute_checksum(patches_dir / name)
+
+
+def test_state_log_compaction(test_env):
+    """Test 30: state.log is folded into state.json once it grows, and a stale log is ignored"""
+    script = test_env["script"]
+    config_dir = test_env["config_dir"]
+    patches_dir = test_env["patches_dir"]
+    backup_dir = config_dir / "backups" / "testgame"
+    state_file = backup_dir / "state.json"
+    state_log = backup_dir / "state.log"
+
+    add_patch_files(patches_dir, 30)
+    result = run_patcher(script, config_dir, "apply")
+    assert result.returncode == 0
+
+    replace_file(patches_dir / "file1.txt", b"patched content v2")
+    result = run_patcher(script, config_dir, "apply")
+    assert result.returncode == 0
+    stale_log = state_log.read_bytes()
+
+    replace_file(patches_dir / "file1.txt", b"patched content v3")
+    for i in range(10):
+        replace_file(patches_dir / f"extra{i}.txt", f"extra content {i} v2".encode())
+    result = run_patcher(script, config_dir, "apply")
+    assert result.returncode == 0
+    assert not state_log.exists()
+
+    state = json.loads(state_file.read_text())
+    assert state["file1.txt"]["patched_checksum"] == compute_checksum(patches_dir / "file1.txt")
+
+    # As if the compaction died between writing state.json and removing the log
+    state_log.write_bytes(stale_log)
+    result = run_patcher(script, config_dir, "status")
+    assert result.returncode == 0
+    assert "MODIFIED" not in result.stdout
+
+
+def test_status_with_read_only_backup_dir(test_env):
+    """Test 31: Status still works when the checksum cache can't be saved"""
+    script = test_env["script"]
+    config_dir = test_env["config_dir"]
+    backup_dir = config_dir / "backups" / "testgame"
+
+    result = run_patcher(script, config_dir, "apply")
+    assert result.returncode == 0
+    (backup_dir / "checksums.json").unlink()
+
+    with readonly(backup_dir, 0o555):
+        result = run_patcher(script, config_dir, "status")
+    assert result.returncode == 0, result.stderr
+    assert "Summary: 3 clean" in result.stdout
+
+
+def test_patch_digest_cache_drops_removed_patches(test_env):
+    """Test 32: Patch files removed from the patches directory are dropped from the digest cache"""
+    script = test_env["script"]
+    config_dir = test_env["config_dir"]
+    patches_dir = test_env["patches_dir"]
+    digests_file = config_dir / "cache" / "testgame" / "patch_digests.json"
+
+    def cached_paths():
+        return {key.split(":", 1)[1] for key in json.loads(digests_file.read_text())}
+
+    extra_patch = patches_dir / "extra.txt"
+    extra_patch.write_bytes(b"extra content")
+    # Recently modified files aren't cached, see RACY_MTIME_WINDOW_NS
+    an_hour_ago = time.time() - 3600
+    os.utime(extra_patch, (an_hour_ago, an_hour_ago))
+
+    result = run_patcher(script, config_dir, "apply")
+    assert result.returncode == 0
+    assert str(extra_patch) in cached_paths()
+
+    extra_patch.unlink()
+    result = run_patcher(script, config_dir, "apply")
+    assert result.returncode == 0
+    assert str(extra_patch) not in cached_paths()
+
+
+def test_rollback_restores_previous_patch(test_env, monkeypatch):
+    """Test 33: A failed re-apply puts back the previously applied patches, not the originals"""
+    script = test_env["script"]
+    config_dir = test_env["config_dir"]
+    game_target = test_env["game_target"]
+    patches_dir = test_env["patches_dir"]
+
+    result = run_patcher(script, config_dir, "apply")
+    assert result.returncode == 0
+
+    replace_file(patches_dir / "file1.txt", b"patched content v2")
+    replace_file(patches_dir / "file2.txt", b"patched content v2")
+
+    game_patcher = load_patcher(script).GamePatcher
+    link_or_copy = game_patcher._link_or_copy
+
+    def failing_link_or_copy(self, src, dst):
+        if dst.name == "file2.txt":
+            raise OSError("simulated copy failure")
+        link_or_copy(self, src, dst)
+
+    monkeypatch.setattr(game_patcher, "_link_or_copy", failing_link_or_copy)
+    result = run_patcher(script, config_dir, "apply")
+    monkeypatch.undo()
+    assert result.returncode != 0
+    assert "rolling back" in result.stdout.lower()
+
+    assert_files(game_target, {
+        "file1.txt": "patched content 1",
+        "file2.txt": "patched content 2",
+        "newfile.txt": "new file content",
+    })
+    assert not list(game_target.glob(".*.patcher-stash"))
+
+    result = run_patcher(script, config_dir, "status")
+    assert result.returncode == 0
+    assert "MODIFIED" not in result.stdout
+
+
+def test_cross_filesystem_backup(test_env, monkeypatch):
+    """Test 34: Backups on another filesystem are copied and hashed in a single pass"""
+    script = test_env["script"]
+    config_dir = test_env["config_dir"]
+    game_target = test_env["game_target"]
+    backup_dir = config_dir / "backups" / "testgame"
+
+    game_patcher = load_patcher(script).GamePatcher
+    copy_and_hash = game_patcher._copy_and_hash
+    copied = []
+
+    def counting_copy_and_hash(self, src, dst):
+        copied.append(Path(dst).name)
+        return copy_and_hash(self, src, dst)
+
+    monkeypatch.setattr(game_patcher, "_same_filesystem", lambda self, path, other: False)
+    monkeypatch.setattr(game_patcher, "_copy_and_hash", counting_copy_and_hash)
+
+    result = run_patcher(script, config_dir, "apply")
+    assert result.returncode == 0
+    assert sorted(copied) == ["file1.txt", "file2.txt"]
+
+    assert_files(backup_dir, {
+        "file1.txt": "original content 1",
+        "file2.txt": "original content 2",
+        "newfile.txt": None,
+    })
+    state = json.loads((backup_dir / "state.json").read_text())
+    for name in ("file1.txt", "file2.txt"):
+        assert state[name]["original_checksum"] == compute_checksum(backup_dir / name)
+        assert state[name]["patched_checksum"] == compute_checksum(game_target / name)
+
+    result = run_patcher(script, config_dir, "revert")
+    assert result.returncode == 0
+    assert_files(game_target, {
+        "file1.txt": "original content 1",
+        "file2.txt": "original content 2",
+        "newfile.txt": None,
+    })
+
+
+def update_game_config(config_dir, **settings):
+    """Set extra options for testgame in config.json"""
+    config_file = config_dir / "config.json"
+    config = json.loads(config_file.read_text())
+    config["games"]["testgame"].update(settings)
+    config_file.write_text(json.dumps(config, indent=2))
+
+
+@pytest.mark.parametrize(
+    "setting, value",
+    [("link_mode", "symlink"), ("hash_algorithm", "md5")],
+)
+def test_invalid_game_settings(test_env, setting, value):
+    """Test 35: Unknown link_mode and hash_algorithm values are rejected"""
+    script = test_env["script"]
+    config_dir = test_env["config_dir"]
+    game_target = test_env["game_target"]
+
+    update_game_config(config_dir, **{setting: value})
+
+    result = run_patcher(script, config_dir, "apply")
+    assert result.returncode != 0
+    assert f"Invalid {setting} '{value}'" in result.stderr
+    assert (game_target / "file1.txt").read_text() == "original content 1"
+
+
+def test_hash_algorithm_missing_package(test_env):
+    """Test 36: Using an algorithm whose package isn't installed fails with a clear error"""
+    script = test_env["script"]
+    config_dir = test_env["config_dir"]
+    game_target = test_env["game_target"]
+
+    patcher = load_patcher(script)
+    missing = [
+        name for name in patcher.HASH_ALGORITHM_PACKAGES
+        if name not in patcher.HASH_ALGORITHMS
+    ]
+    if not missing:
+        pytest.skip("all optional hash packages are installed")
+
+    update_game_config(config_dir, hash_algorithm=missing[0])
+
+    result = run_patcher(script, config_dir, "apply")
+    assert result.returncode != 0
+    package = patcher.HASH_ALGORITHM_PACKAGES[missing[0]]
+    assert f"requires the '{package}' package" in result.stderr
+    assert "Traceback" not in result.stderr
+    assert (game_target / "file1.txt").read_text() == "original content 1"
+
+
+def test_hash_algorithm_change_rehashes_originals(test_env, monkeypatch):
+    """Test 37: State records the checksum algorithm, and switching it rehashes the originals"""
+    script = test_env["script"]
+    config_dir = test_env["config_dir"]
+    game_target = test_env["game_target"]
+    backup_dir = config_dir / "backups" / "testgame"
+    state_file = backup_dir / "state.json"
+
+    # blake2b stands in for an optional algorithm, so this runs with hashlib only
+    patcher = load_patcher(script)
+    monkeypatch.setitem(patcher.HASH_ALGORITHMS, "blake2b", hashlib.blake2b)
+    monkeypatch.setitem(patcher.HASH_ALGORITHM_PACKAGES, "blake2b", "hashlib")
+
+    update_game_config(config_dir, hash_algorithm="blake2b")
+    result = run_patcher(script, config_dir, "apply")
+    assert result.returncode == 0
+
+    state = json.loads(state_file.read_text())
+    original = (backup_dir / "file1.txt").read_bytes()
+    assert state["file1.txt"]["checksum_algorithm"] == "blake2b"
+    assert state["file1.txt"]["original_checksum"] == hashlib.blake2b(original).hexdigest()
+
+    update_game_config(config_dir, hash_algorithm="sha256")
+    result = run_patcher(script, config_dir, "status")
+    assert result.returncode == 0
+    assert "MODIFIED" not in result.stdout
+
+    result = run_patcher(script, config_dir, "apply")
+    assert result.returncode == 0
+
+    state = json.loads(state_file.read_text())
+    for name in ("file1.txt", "file2.txt", "newfile.txt"):
+        assert state[name]["checksum_algorithm"] == "sha256"
+        assert state[name]["patched_checksum"] == compute_checksum(game_target / name)
+    assert state["file1.txt"]["original_checksum"] == compute_checksum(backup_dir / "file1.txt")
+
+    result = run_patcher(script, config_dir, "revert")
+    assert result.returncode == 0
+    assert (game_target / "file1.txt").read_text() == "original content 1"
+
+
+def test_state_files_permissions(test_env):
+    """Test 38: State and cache files get the usual permissions, and rewrites keep them"""
+    script = test_env["script"]
+    config_dir = test_env["config_dir"]
+    patches_dir = test_env["patches_dir"]
+    backup_dir = config_dir / "backups" / "testgame"
+    state_file = backup_dir / "state.json"
+
+    umask = os.umask(0)
+    os.umask(umask)
+
+    result = run_patcher(script, config_dir, "apply")
+    assert result.returncode == 0
+    for path in (
+        state_file,
+        backup_dir / "checksums.json",
+        config_dir / "cache" / "testgame" / "patch_digests.json",
+    ):
+        assert stat.S_IMODE(path.stat().st_mode) == 0o666 & ~umask, path
+
+    state_file.chmod(0o640)
+    replace_file(patches_dir / "file1.txt", b"patched content v2")
+    raw_state = state_file.read_bytes()
+    result = run_patcher(script, config_dir, "apply")
+    assert result.returncode == 0
+    assert state_file.read_bytes() != raw_state
+    assert stat.S_IMODE(state_file.stat().st_mode) == 0o640
 
 
 if __name__ == "__main__":